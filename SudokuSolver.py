@@ -1,13 +1,23 @@
-from typing import Tuple, List, Iterator, Optional, Union
+from typing import List, Iterator, Union, Tuple
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 import enum
+import os
 import time
 
+from solver_core import ROW_OF, COL_OF, BOX_OF, CONTRADICTION, PROGRESS, hidden_singles, peer_numbers, propagate
+
+
+# Nodes to search in-process before the rest of a search is shared out over a process pool. Starting a pool takes
+# about 15 ms, the time the compiled kernels need for roughly 1250 nodes, so smaller searches never pay for it
+PARALLEL_NODE_BUDGET: int = 5000
+
+# Translation table from cell numbers (0-9) to their ASCII digits
+ASCII_DIGITS: bytes = bytes.maketrans(bytes(range(10)), b'0123456789')
+
 
 class SudokuCellReturnValues(enum.Enum):
-    ALREADY_FILLED: int = -1
     ZERO_VALUES: int = 0
-    ONE_VALUE: int = 1
-    MULTIPLE_VALUES: int = 2
 
 
 class SudokuBoardReturnValues(enum.Enum):
@@ -16,84 +26,14 @@ class SudokuBoardReturnValues(enum.Enum):
     SOLVED: int = 1
 
 
-class SudokuTreeNodeState(enum.Enum):
-    NO_SOLUTIONS: int = -1
-    UNKNOWN: int = 0
-    SOLVED: int = 1
-
-
-class SudokuCell(object):
+def iterate_bits(mask: int) -> Iterator[int]:
     """
-    A cell in a Sudoku Board
+    Yields each number marked in a bitmask, lowest first
     """
-
-    def __init__(self, master: 'SudokuBoard', number: int, position: Tuple[int, int]):
-        self.number = number  # Number of the square - 0 if default
-        self.master = master  # Parent Board
-        self.position = position  # (row, column)
-        self.possible_numbers: set = set()  # Blank set for future use
-
-    def __str__(self):
-        return str(self.number)
-
-    def get_indexes(self) -> Tuple[int, int, int]:
-        """
-        Returns the index of itself in its master's groupings
-        """
-        row_index, column_index = self.position
-        box_index = row_index // 3 * 3 + column_index // 3
-
-        return row_index, column_index, box_index
-
-    def solve_this_cell(self) -> int:
-        """
-        Looks through the possible numbers the current cell can have; returns how many there are
-        If 0: return 0
-        If 1: change the number, update row/column/box, return 1
-        If 2+: return 2+
-        """
-
-        if self.number != 0:  # Need to make sure that the current cell needs to be filled in
-            return SudokuCellReturnValues.ALREADY_FILLED
-
-        row_index, column_index, box_index = self.get_indexes()
-
-        # Grabs the possible numbers
-        self.possible_numbers = set(range(1, 10)).intersection(self.master.get_rows()[row_index].valid_numbers,
-                                                               self.master.get_columns()[column_index].valid_numbers,
-                                                               self.master.get_boxes()[box_index].valid_numbers)
-
-        # Does logic on the result
-        if len(self.possible_numbers) == 1:
-            self.number = next(iter(self.possible_numbers))
-            return SudokuCellReturnValues.ONE_VALUE
-        elif len(self.possible_numbers) == 0:
-            return SudokuCellReturnValues.ZERO_VALUES
-        else:
-            return SudokuCellReturnValues.MULTIPLE_VALUES
-
-
-class SudokuSet(object):
-    """
-    A Set(Row/Column/Box) in a Sudoku Board
-    """
-
-    def __init__(self):
-        self.squares: List[SudokuCell] = []  # All the squares in the current set
-        self.valid_numbers: set = set(range(1, 10))  # Set of valid numbers for future use
-
-    def eliminate_numbers(self) -> None:
-        """
-        Goes through each square and takes them out of the possibilities
-        """
-        for square in self.squares:
-            try:
-                self.valid_numbers.remove(square.number)
-            except KeyError:
-                pass
-
-    def add_square(self, square: SudokuCell):
-        self.squares.append(square)
+    while mask:
+        bit = mask & -mask
+        yield bit.bit_length() - 1
+        mask ^= bit
 
 
 class SudokuBoard(object):
@@ -101,160 +41,136 @@ class SudokuBoard(object):
     A Sudoku Board
     """
 
+    __slots__ = ('input_board', 'cells', 'row_mask', 'col_mask', 'box_mask', 'best_cell_idx', 'best_cell_mask')
+
     def __init__(self, inpt_board: str):
         self.input_board = inpt_board
 
-        self.board: List[List[SudokuCell]] = []
-        self.rows: List[SudokuSet] = []
-        self.columns: List[SudokuSet] = []
-        self.boxes: List[SudokuSet] = []
-
-        self.tree_node: Optional['SudokuTreeNode'] = None
-        self.multi_possibility_cells: List[SudokuCell] = []
-
-    def get_rows(self) -> List[SudokuSet]:
-        """
-        Gets the rows
-        """
-        return self.rows
+        self.cells: array = array('b')  # Numbers of the 81 cells, row by row - 0 if default
+        self.row_mask: array = array('h')  # Bitmask of valid numbers (bits 1-9) for each row
+        self.col_mask: array = array('h')  # Bitmask of valid numbers (bits 1-9) for each column
+        self.box_mask: array = array('h')  # Bitmask of valid numbers (bits 1-9) for each box
 
-    def get_columns(self) -> List[SudokuSet]:
-        """
-        Gets the columns
-        """
-        return self.columns
-
-    def get_boxes(self) -> List[SudokuSet]:
-        """
-        Gets the boxes
-        """
-        return self.boxes
+        self.best_cell_idx: int = -1  # Index of the empty cell with the fewest possible numbers
+        self.best_cell_mask: int = 0  # Possible numbers of that cell
 
     def get_str_rep_of_board(self) -> str:
         """
         Converts board to a string
         """
-        return '\n'.join([''.join(map(str, row)) for row in self.board])
+        digits = self.cells.tobytes().translate(ASCII_DIGITS).decode('ascii')
+        return '\n'.join([digits[row:row + 9] for row in range(0, len(digits), 9)])
 
-    def setup_internal_representation(self) -> None:
+    def setup_internal_representation(self) -> bool:
         """
-        Creates the internal representation of the board: setting the board, the rows, the columns, and the boxes 
+        Creates the internal representation of the board: setting the cells, and the row, column and box masks,
+        then eliminates the given numbers from the masks
+        Returns False if two given numbers clash with each other
         """
         temp_board = self.input_board.split('\n')
 
         # Internal Representation of the board
-        self.board: List[List[SudokuCell]] = [[] for _ in range(9)]
-        self.rows: List[SudokuSet] = [SudokuSet() for _ in range(9)]
-        self.columns: List[SudokuSet] = [SudokuSet() for _ in range(9)]
-        self.boxes: List[SudokuSet] = [SudokuSet() for _ in range(9)]
-
-        for row in range(9):
-            for column in range(9):
-                cell = SudokuCell(self, int(temp_board[row][column]), (row, column))
-                self.board[row].append(cell)
-                self.rows[row].add_square(cell)
-                self.columns[column].add_square(cell)
-                self.boxes[cell.get_indexes()[2]].add_square(cell)
-
-    def set_tree_node(self, tree_node: 'SudokuTreeNode') -> None:
+        self.cells = array('b', [int(temp_board[row][column]) for row in range(9) for column in range(9)])
+        self.row_mask = array('h', [0x3FE] * 9)
+        self.col_mask = array('h', [0x3FE] * 9)
+        self.box_mask = array('h', [0x3FE] * 9)
+
+        # Baseline elimination of the given numbers
+        for i in range(81):
+            if self.cells[i] != 0:
+                if peer_numbers(self.cells, i) & (1 << self.cells[i]):
+                    return False
+
+                bit = ~(1 << self.cells[i])
+                self.row_mask[ROW_OF[i]] &= bit
+                self.col_mask[COL_OF[i]] &= bit
+                self.box_mask[BOX_OF[i]] &= bit
+
+        return True
+
+    def clone(self) -> 'SudokuBoard':
         """
-        Sets the tree node that this board is correlated to.
+        Makes a copy of the board's internal representation without re-parsing the input board
         """
-        self.tree_node = tree_node
+        board = SudokuBoard(self.input_board)
+        board.cells = self.cells[:]
+        board.row_mask = self.row_mask[:]
+        board.col_mask = self.col_mask[:]
+        board.box_mask = self.box_mask[:]
+        return board
 
-    def del_internal_representation(self) -> None:
+    def get_state(self) -> Tuple[bytes, bytes, bytes, bytes]:
         """
-        Deletes the internal representation to help with memory management and to kick in Python's garbage collection
+        Gets the internal representation as bytes, so the board can be handed to another process
         """
-        for sudoku_set in self.rows + self.columns + self.boxes:
-            sudoku_set.squares = []
-            sudoku_set.valid_numbers = set()
-        for row in range(len(self.board)):
-            for cell in self.board[row]:
-                cell.master = None
-
-            self.board[row] = []
-        self.board = []
-        self.boxes = []
-        self.rows = []
-        self.columns = []
-
-    def del_tree_node(self) -> None:
+        return self.cells.tobytes(), self.row_mask.tobytes(), self.col_mask.tobytes(), self.box_mask.tobytes()
+
+    def set_state(self, state: Tuple[bytes, bytes, bytes, bytes]) -> None:
         """
-        Deletes the reference to the tree node that this board is correlated to.
+        Sets the internal representation from the output of get_state
         """
-        self.tree_node = None
+        cells, row_mask, col_mask, box_mask = state
+        self.cells = array('b', cells)
+        self.row_mask = array('h', row_mask)
+        self.col_mask = array('h', col_mask)
+        self.box_mask = array('h', box_mask)
 
-    def do_one_iteration(self) -> Union[int, bool]:
+    def do_one_iteration(self) -> Union[SudokuCellReturnValues, bool]:
         """
         Does one iteration out of the xx amount left
-        1. clear old cached data
-        2. Iterate through the cells
-        3. For each cell, call solve_this_cell()
-        4. If filled: pass - If zeros: stop - if one: set change_in_board to true - if 2+: add to list of multi cells
-        5. return if there is a change in the board
-        """
-        self.multi_possibility_cells = []
-        change_in_board = False
-
-        for row in self.board:
-            for cell in row:
-                result = cell.solve_this_cell()
-
-                if result == SudokuCellReturnValues.ALREADY_FILLED:
-                    continue
-                elif result == SudokuCellReturnValues.ZERO_VALUES:
-                    return result
-                elif result == SudokuCellReturnValues.ONE_VALUE:
-                    row_index, column_index, box_index = cell.get_indexes()
-                    self.rows[row_index].eliminate_numbers()
-                    self.columns[column_index].eliminate_numbers()
-                    self.boxes[box_index].eliminate_numbers()
-
-                    change_in_board = True
-                elif result == SudokuCellReturnValues.MULTIPLE_VALUES:
-                    self.multi_possibility_cells.append(cell)
-
-        return change_in_board
-
-    def establish_child_tree_nodes(self) -> Iterator['SudokuTreeNode']:
-        """
-        Generator for child nodes
-        1. Get the cell with lowest possibilities
-        2. Make a duplicate of current board with new node associated with it
-        3. Change the value of selected cell to a guess
-        """
+        1. Run the propagate kernel over the cells and masks
+        2. If a cell has zero possibilities: stop
+        3. Keep track of the cell with the lowest possibilities
+        4. return if there is a change in the board
+        """
+        status, self.best_cell_idx, self.best_cell_mask = propagate(self.cells, self.row_mask,
+                                                                    self.col_mask, self.box_mask)
+        if status == CONTRADICTION:
+            return SudokuCellReturnValues.ZERO_VALUES
 
-        lowest, cell_position, possibilities = 10, (-1, -1), set()
+        return status == PROGRESS
 
-        for cell in self.multi_possibility_cells:
-            if len(cell.possible_numbers) < lowest:
-                lowest, cell_position, possibilities = len(cell.possible_numbers), cell.position, cell.possible_numbers
+    def do_hidden_singles(self) -> Union[SudokuCellReturnValues, bool]:
+        """
+        Fills in the numbers that only fit in one cell of a row, column or box
+        1. Run the hidden_singles kernel over the cells and masks
+        2. If a number fits nowhere in a row, column or box: stop
+        3. return if there is a change in the board
+        """
+        status = hidden_singles(self.cells, self.row_mask, self.col_mask, self.box_mask)
+        if status == CONTRADICTION:
+            return SudokuCellReturnValues.ZERO_VALUES
 
-        row, column = cell_position
+        return status == PROGRESS
 
-        for possibility in possibilities:
-            str_temp_board = list(map(list, self.get_str_rep_of_board().split('\n')))
-            str_temp_board[row][column] = possibility
+    def establish_child_boards(self) -> Iterator['SudokuBoard']:
+        """
+        Generator for child boards
+        1. Get the cell with lowest possibilities, as tracked by do_one_iteration
+        2. Make a duplicate of current board
+        3. Change the value of selected cell to a guess
+        """
+        cell_index, possibilities = self.best_cell_idx, self.best_cell_mask
 
-            temp_board = SudokuBoard('\n'.join([''.join(map(str, row)) for row in str_temp_board]))
-            temp_tree_node = SudokuTreeNode(temp_board, self.tree_node.depth + 1, self.tree_node)
-            temp_board.set_tree_node(temp_tree_node)
-            yield temp_tree_node
+        for possibility in iterate_bits(possibilities):
+            temp_board = self.clone()
+            temp_board.cells[cell_index] = possibility
+            bit = ~(1 << possibility)
+            temp_board.row_mask[ROW_OF[cell_index]] &= bit
+            temp_board.col_mask[COL_OF[cell_index]] &= bit
+            temp_board.box_mask[BOX_OF[cell_index]] &= bit
+            yield temp_board
 
-    def solve_board(self) -> int:
+    def solve_board(self) -> SudokuBoardReturnValues:
         """
-        Solves the board
-        0. Get initial baseline elimination along side setting stuff up
-        1. While there are changes, continue trying to fill in obvious numbers
-        2. Check to see if done
-        3. If done, put it in solved boards array, stop
-        4. If not done, call establish_child_tree_nodes and add that to the current node's child nodes
-        5. For each child node call solve_board
+        Fills in the board as far as it can without guessing
+        0. If this is not a cloned board, set up the internal representation; stop if the given numbers clash
+        1. While there are changes, continue trying to fill in obvious numbers, then hidden ones
+        2. If a cell or a number has no possible place, there are no solutions
+        3. Otherwise check to see if done; if not, the board needs a guess
         """
-        self.setup_internal_representation()
-        for sudoku_set in self.rows + self.columns + self.boxes:
-            sudoku_set.eliminate_numbers()
+        if not self.cells and not self.setup_internal_representation():
+            return SudokuBoardReturnValues.NO_SOLUTIONS
 
         result = True
         while result:
@@ -263,88 +179,109 @@ class SudokuBoard(object):
             if result == SudokuCellReturnValues.ZERO_VALUES:
                 return SudokuBoardReturnValues.NO_SOLUTIONS
 
-        board = self.get_str_rep_of_board()
+            if not result:
+                # The best cell from the last iteration stays valid as long as this makes no changes either
+                result = self.do_hidden_singles()
+                if result == SudokuCellReturnValues.ZERO_VALUES:
+                    return SudokuBoardReturnValues.NO_SOLUTIONS
 
-        if '0' not in board:
-            self.tree_node.solved_boards.append(board)
-            self.del_internal_representation()
+        if 0 not in self.cells:
             return SudokuBoardReturnValues.SOLVED
         else:
-            assert len(self.multi_possibility_cells) > 0
-            for tree_node in self.establish_child_tree_nodes():
-                self.tree_node.child_nodes.append(tree_node)
-
-            self.del_internal_representation()
-            self.tree_node.solve_child_boards()
-
+            assert self.best_cell_idx != -1
             return SudokuBoardReturnValues.UNKNOWN
 
 
-class SudokuTreeNode(object):
+def solve_subtree(state: Tuple[bytes, bytes, bytes, bytes], max_nodes: int = 0,
+                  find_all: bool = True) -> Tuple[Tuple[str, ...], int, Tuple[Tuple[bytes, bytes, bytes, bytes], ...]]:
     """
-    A Sudoku Tree Node
+    Solves the subtree under a board state with an explicit stack of boards (depth first),
+    returning (solved boards, nodes visited, unfinished board states). Module level so that worker processes can run it
+    1. Pop a board and fill it in as far as possible
+    2. If solved, put it in solved boards, and stop there unless find_all is set
+    3. If a guess is needed, push the child boards from establish_child_boards
+    4. If max_nodes is set and that many nodes have been visited, stop and return the states still on the stack,
+       in the order they would have been searched
+    Popped boards are only referenced by the stack, so they are freed as soon as they have been handled
     """
-
     solved_boards = []
+    total_nodes = 0
 
-    def __init__(self, board: SudokuBoard, depth: int, parent: 'SudokuTreeNode' = None):
-        self.child_nodes: List[SudokuTreeNode] = []  # All the child boards
-        self.current_board: SudokuBoard = board  # The board associated with the node
-        self.depth = depth  # The depth of the current node
-        self.original_board: str = board.get_str_rep_of_board()
-        self.parent = parent
+    subtree_board = SudokuBoard('')
+    subtree_board.set_state(state)
 
-        self.state: int = SudokuTreeNodeState.UNKNOWN
+    stack = [subtree_board]
+    while stack:
+        if max_nodes and total_nodes >= max_nodes:
+            return tuple(solved_boards), total_nodes, tuple(board.get_state() for board in reversed(stack))
 
-    def get_current_board(self) -> SudokuBoard:
-        """
-        Gets the board associated with the node
-        """
-        return self.current_board
+        board = stack.pop()
+        total_nodes += 1
 
-    def solve_board(self) -> None:
-        """
-        Solves the board correlated to the node
-        """
-        result = self.current_board.solve_board()
+        result = board.solve_board()
         if result == SudokuBoardReturnValues.SOLVED:
-            self.state = SudokuTreeNodeState.SOLVED
-        elif result == SudokuBoardReturnValues.NO_SOLUTIONS:
-            self.state = SudokuTreeNodeState.NO_SOLUTIONS
+            solved_boards.append(board.get_str_rep_of_board())
+            if not find_all:
+                break
+        elif result == SudokuBoardReturnValues.UNKNOWN:
+            # Reversed so the lowest guess is popped first
+            stack.extend(reversed(list(board.establish_child_boards())))
 
-    def solve_child_boards(self) -> None:
-        """
-        Solves all the child boards correlated to the node.
-        Helps with memory management by deleting nodes w/o solved boards
-        """
-        for node in self.child_nodes:
-            node.solve_board()
+    return tuple(solved_boards), total_nodes, ()
 
-        if self.state == SudokuTreeNodeState.UNKNOWN:
-            self.state = SudokuTreeNodeState.NO_SOLUTIONS
-            for node in self.child_nodes:
-                if node == SudokuTreeNodeState.SOLVED:
-                    self.state = SudokuTreeNodeState.SOLVED
 
-        for node in self.child_nodes:
-            if node.state == SudokuTreeNodeState.NO_SOLUTIONS:
-                self.prune(node)
+def search_board(inpt_board: str, find_all: bool = True) -> Tuple[Tuple[str, ...], int]:
+    """
+    Solves a board, returning (solved boards, nodes visited)
+    1. Fill in the root board as far as possible
+    2. If it needs a guess, solve the subtree of each root-level guess with solve_subtree
+    3. Unless find_all is set, stop at the first subtree with a solution
+    4. With more than one CPU, once PARALLEL_NODE_BUDGET nodes have been searched, share the unfinished subtrees
+       out over a process pool, as they share nothing.
+       This is only done when finding all solutions, since the pool explores every subtree
+    Sibling subtrees never reach the same board (they differ in the guessed cell), so no seen boards are tracked
+    """
+    root_board = SudokuBoard(inpt_board)
 
-    def find_total_nodes(self) -> int:
-        """
-        Travel function to determine how many nodes there are in total
-        """
-        if len(self.child_nodes) == 0:
-            return 1
-        return sum([board.find_total_nodes() for board in self.child_nodes]) + 1
+    result = root_board.solve_board()
+    if result == SudokuBoardReturnValues.SOLVED:
+        return (root_board.get_str_rep_of_board(),), 1
+    elif result == SudokuBoardReturnValues.NO_SOLUTIONS:
+        return (), 1
+
+    subtree_states = [board.get_state() for board in root_board.establish_child_boards()]
+    workers = os.cpu_count() or 1
+
+    solved_boards = []
+    total_nodes = 1
+
+    # In-process first, until the node budget runs out (no budget with a single CPU or when stopping at a solution)
+    while subtree_states:
+        max_nodes = max(PARALLEL_NODE_BUDGET - total_nodes, 1) if find_all and workers > 1 else 0
+        subtree_solved_boards, subtree_nodes, unfinished_states = solve_subtree(subtree_states.pop(0), max_nodes,
+                                                                                find_all)
+        solved_boards.extend(subtree_solved_boards)
+        total_nodes += subtree_nodes
 
-    def prune(self, node: 'SudokuTreeNode'):
-        for child_node in node.child_nodes:
-            node.prune(child_node)
-        self.child_nodes.pop(self.child_nodes.index(node))
-        node.child_nodes = []
-        node.current_board = None
-        node.parent = None
+        if unfinished_states:
+            subtree_states[:0] = unfinished_states
+            break
+
+        if solved_boards and not find_all:
+            return tuple(solved_boards), total_nodes
+
+    # Whatever is left is a big search, so it goes to the pool unless it is a single subtree
+    if len(subtree_states) > 1:
+        with ProcessPoolExecutor(max_workers=min(len(subtree_states), workers)) as executor:
+            results = list(executor.map(solve_subtree, subtree_states))
+    else:
+        results = [solve_subtree(state) for state in subtree_states]
+
+    for subtree_solved_boards, subtree_nodes, _ in results:
+        solved_boards.extend(subtree_solved_boards)
+        total_nodes += subtree_nodes
+
+    return tuple(solved_boards), total_nodes
 
 
 class SudokuSolverApplication(object):
@@ -352,10 +289,11 @@ class SudokuSolverApplication(object):
     Application class for the Sudoku Solver
     """
 
-    def __init__(self, inpt_board: str):
-        temp_board = SudokuBoard(inpt_board)
-        self.root_node: SudokuTreeNode = SudokuTreeNode(temp_board, 0)  # The root node of the entire tree
-        temp_board.set_tree_node(self.root_node)
+    def __init__(self, inpt_board: str, find_all: bool = True):
+        self.input_board: str = inpt_board  # The board to solve
+        self.find_all: bool = find_all  # Whether to look for every solution or stop at the first one
+        self.solutions: List[str] = []  # The solved boards
+        self.total_nodes: int = 0  # Number of nodes visited while solving
         self.time: int = 0  # Variable to store total time
 
     def solve(self) -> None:
@@ -363,28 +301,30 @@ class SudokuSolverApplication(object):
         Solves the inputted board
         """
         start = time.time()
-        self.root_node.solve_board()
+        solved_boards, self.total_nodes = search_board(self.input_board, self.find_all)
+        self.solutions = list(solved_boards)
         self.time = time.time() - start
 
     def print_solutions(self) -> None:
         """
         Prints the boards and some extra statistics
         """
-        length = len(self.root_node.solved_boards)
+        length = len(self.solutions)
         print(
             f'There {"is" if length == 1 else "are"} {length}',
             f'solution{"" if length == 1 else "s"}{"" if length == 0 else ":"}')
 
-        for board in self.root_node.solved_boards:
+        for board in self.solutions:
             print(board + '\n')
 
         if length == 1:
-            print(f'A total of {self.root_node.find_total_nodes() - 1} guesses were made')
+            print(f'A total of {self.total_nodes - 1} guesses were made')
         else:
-            print(f'There were a total of {self.root_node.find_total_nodes()} nodes in the tree')
+            print(f'There were a total of {self.total_nodes} nodes in the tree')
         print(f'It took {self.time} seconds to finish')
 
 
-solver = SudokuSolverApplication(open('sudoku_board.txt', 'r').read())
-solver.solve()
-solver.print_solutions()
+if __name__ == '__main__':
+    solver = SudokuSolverApplication(open('sudoku_board.txt', 'r').read())
+    solver.solve()
+    solver.print_solutions()
@@ -0,0 +1,203 @@
+from typing import Callable, Tuple
+from array import array
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE: bool = True
+except ImportError:  # Numba is optional - without it the kernel runs as plain Python
+    NUMBA_AVAILABLE: bool = False
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for numba.njit that returns the function unchanged
+        """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+try:
+    import sudoku_core  # The compiled Cython kernels, if they have been built
+except ImportError:
+    sudoku_core = None
+
+
+# Lookup tables mapping a flat cell index (row * 9 + column) to its row, column and box
+ROW_OF: Tuple[int, ...] = tuple(i // 9 for i in range(81))
+COL_OF: Tuple[int, ...] = tuple(i % 9 for i in range(81))
+BOX_OF: Tuple[int, ...] = tuple(i // 27 * 3 + i % 9 // 3 for i in range(81))
+
+# The flat cell indexes belonging to each row, column and box
+ROWS: Tuple[Tuple[int, ...], ...] = tuple(tuple(i for i in range(81) if ROW_OF[i] == n) for n in range(9))
+COLUMNS: Tuple[Tuple[int, ...], ...] = tuple(tuple(i for i in range(81) if COL_OF[i] == n) for n in range(9))
+BOXES: Tuple[Tuple[int, ...], ...] = tuple(tuple(i for i in range(81) if BOX_OF[i] == n) for n in range(9))
+UNITS: Tuple[Tuple[int, ...], ...] = ROWS + COLUMNS + BOXES
+
+# The 20 other cells sharing a row, column or box with each cell
+PEERS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(j for j in range(81)
+          if j != i and (ROW_OF[j] == ROW_OF[i] or COL_OF[j] == COL_OF[i] or BOX_OF[j] == BOX_OF[i]))
+    for i in range(81))
+
+# Number of set bits for every 10 bit mask
+POPCOUNT: Tuple[int, ...] = tuple(bin(mask).count('1') for mask in range(1 << 10))
+
+CONTRADICTION: int = -1
+NO_PROGRESS: int = 0
+PROGRESS: int = 1
+
+# Explicit Numba signatures, so the kernels are compiled (or loaded from the cache) on import instead of on first call
+# The cells and masks are array.array objects, which Numba types as PyArray rather than as NumPy arrays
+KERNEL_ARGUMENTS: str = "PyArray(int8, 1, 'C'), PyArray(int16, 1, 'C'), PyArray(int16, 1, 'C'), PyArray(int16, 1, 'C')"
+PROPAGATE_SIGNATURE: str = f'UniTuple(int64, 3)({KERNEL_ARGUMENTS})'
+HIDDEN_SINGLES_SIGNATURE: str = f'int64({KERNEL_ARGUMENTS})'
+
+
+@njit(PROPAGATE_SIGNATURE, cache=True)
+def propagate(cells, row_mask, col_mask, box_mask) -> Tuple[int, int, int]:
+    """
+    Does one pass over the empty cells, filling in every cell with a single possible number
+    cells is an int8 array of 81 numbers, the masks are int16 arrays of 9 bitmasks (bits 1-9)
+    Returns (status, index of the cell with the lowest possibilities, possible numbers of that cell)
+    where status is CONTRADICTION, NO_PROGRESS or PROGRESS
+    """
+    status = NO_PROGRESS
+    best_idx, best_pop, best_mask = -1, 10, 0
+
+    for i in range(81):
+        if cells[i]:
+            continue
+
+        row_index, column_index, box_index = ROW_OF[i], COL_OF[i], BOX_OF[i]
+        possible_numbers = row_mask[row_index] & col_mask[column_index] & box_mask[box_index]
+
+        if possible_numbers == 0:
+            return CONTRADICTION, -1, 0
+        elif possible_numbers & (possible_numbers - 1) == 0:  # Only a single bit is set
+            cells[i] = POPCOUNT[possible_numbers - 1]  # 1 << n minus one has exactly n bits set
+            row_mask[row_index] &= ~possible_numbers
+            col_mask[column_index] &= ~possible_numbers
+            box_mask[box_index] &= ~possible_numbers
+
+            status = PROGRESS
+        elif best_pop > 2:  # No cell with several possibilities can beat two
+            count = POPCOUNT[possible_numbers]
+            if count < best_pop:
+                best_idx, best_pop, best_mask = i, count, possible_numbers
+
+    return status, best_idx, best_mask
+
+
+@njit(HIDDEN_SINGLES_SIGNATURE, cache=True)
+def hidden_singles(cells, row_mask, col_mask, box_mask) -> int:
+    """
+    Does one pass over the rows, columns and boxes, filling in every number that only fits in one cell of the unit
+    Returns CONTRADICTION if a missing number fits nowhere in a unit, otherwise NO_PROGRESS or PROGRESS
+    """
+    status = NO_PROGRESS
+
+    for unit in UNITS:
+        # Numbers already placed, possible in at least one empty cell, and possible in at least two empty cells
+        placed, once, twice = 0, 0, 0
+        for i in unit:
+            if cells[i]:
+                placed |= 1 << cells[i]
+            else:
+                possible_numbers = row_mask[ROW_OF[i]] & col_mask[COL_OF[i]] & box_mask[BOX_OF[i]]
+                twice |= once & possible_numbers
+                once |= possible_numbers
+
+        if 0x3FE & ~placed & ~once:
+            return CONTRADICTION
+
+        hidden = once & ~twice
+        while hidden:
+            bit = hidden & -hidden
+            hidden ^= bit
+
+            # An earlier number filled in on this pass may have taken the only cell
+            target = -1
+            for i in unit:
+                if cells[i] == 0 and row_mask[ROW_OF[i]] & col_mask[COL_OF[i]] & box_mask[BOX_OF[i]] & bit:
+                    target = i
+                    break
+            if target == -1:
+                return CONTRADICTION
+
+            cells[target] = POPCOUNT[bit - 1]
+            row_mask[ROW_OF[target]] &= ~bit
+            col_mask[COL_OF[target]] &= ~bit
+            box_mask[BOX_OF[target]] &= ~bit
+
+            status = PROGRESS
+
+    return status
+
+
+def peer_numbers(cells, i: int) -> int:
+    """
+    Returns the bitmask of numbers (bits 1-9) already used by the peers of cell i
+    Works straight from the cells, for when the row, column and box masks are not being maintained
+    """
+    used = 0
+    for peer in PEERS[i]:
+        used |= 1 << cells[peer]
+    return used & 0x3FE
+
+
+def build_unrolled_propagate() -> Callable:
+    """
+    Generates a version of propagate with the loop over the 81 cells unrolled
+    Every cell and mask becomes a local variable, which plain Python reads and writes much faster than array items
+    """
+    cell_names = ', '.join(f'c{i}' for i in range(81))
+    lines = [
+        'def propagate(cells, row_mask, col_mask, box_mask):',
+        f'    {cell_names}, = cells',
+        f'    {", ".join(f"rm{n}" for n in range(9))}, = row_mask',
+        f'    {", ".join(f"cm{n}" for n in range(9))}, = col_mask',
+        f'    {", ".join(f"bm{n}" for n in range(9))}, = box_mask',
+        '    status = NO_PROGRESS',
+        '    best_idx, best_pop, best_mask = -1, 10, 0',
+    ]
+
+    for i in range(81):
+        row, column, box = f'rm{ROW_OF[i]}', f'cm{COL_OF[i]}', f'bm{BOX_OF[i]}'
+        lines += [
+            f'    if not c{i}:',
+            f'        m = {row} & {column} & {box}',
+            '        if not m:',
+            '            return CONTRADICTION, -1, 0',
+            '        elif not m & (m - 1):',
+            f'            c{i} = POPCOUNT[m - 1]',
+            f'            {row} &= ~m',
+            f'            {column} &= ~m',
+            f'            {box} &= ~m',
+            '            status = PROGRESS',
+            '        elif best_pop > 2:',
+            '            count = POPCOUNT[m]',
+            '            if count < best_pop:',
+            f'                best_idx, best_pop, best_mask = {i}, count, m',
+        ]
+
+    lines += [
+        '    if status == PROGRESS:',
+        f'        cells[:] = array("b", ({cell_names}))',
+        f'        row_mask[:] = array("h", ({", ".join(f"rm{n}" for n in range(9))}))',
+        f'        col_mask[:] = array("h", ({", ".join(f"cm{n}" for n in range(9))}))',
+        f'        box_mask[:] = array("h", ({", ".join(f"bm{n}" for n in range(9))}))',
+        '    return status, best_idx, best_mask',
+    ]
+
+    namespace = {'array': array, 'POPCOUNT': POPCOUNT, 'CONTRADICTION': CONTRADICTION,
+                 'NO_PROGRESS': NO_PROGRESS, 'PROGRESS': PROGRESS}
+    exec(compile('\n'.join(lines), '<unrolled propagate>', 'exec'), namespace)
+
+    unrolled_propagate = namespace['propagate']
+    unrolled_propagate.__doc__ = propagate.__doc__
+    return unrolled_propagate
+
+
+if sudoku_core is not None:
+    propagate, hidden_singles = sudoku_core.propagate, sudoku_core.hidden_singles  # Prefer the compiled Cython kernels
+elif not NUMBA_AVAILABLE:
+    propagate = build_unrolled_propagate()
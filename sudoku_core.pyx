@@ -0,0 +1,114 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True, language_level=3
+"""
+C versions of the propagate and hidden_singles kernels in solver_core.py
+Build it in place with `cythonize -i sudoku_core.pyx`; solver_core picks it up automatically
+"""
+
+cdef extern from *:
+    int __builtin_popcount(unsigned int x) nogil
+    int __builtin_ctz(unsigned int x) nogil
+
+cdef enum:
+    CONTRADICTION = -1
+    NO_PROGRESS = 0
+    PROGRESS = 1
+
+# Lookup tables mapping a flat cell index (row * 9 + column) to its row, column and box
+cdef int ROW_OF[81]
+cdef int COL_OF[81]
+cdef int BOX_OF[81]
+
+# The flat cell indexes belonging to each row, column and box
+cdef int UNITS[27][9]
+
+for _i in range(81):
+    ROW_OF[_i] = _i // 9
+    COL_OF[_i] = _i % 9
+    BOX_OF[_i] = _i // 27 * 3 + _i % 9 // 3
+
+    UNITS[ROW_OF[_i]][COL_OF[_i]] = _i
+    UNITS[9 + COL_OF[_i]][ROW_OF[_i]] = _i
+    UNITS[18 + BOX_OF[_i]][ROW_OF[_i] % 3 * 3 + COL_OF[_i] % 3] = _i
+
+
+def propagate(signed char[::1] cells, short[::1] row_mask,
+              short[::1] col_mask, short[::1] box_mask):
+    """
+    Does one pass over the empty cells, filling in every cell with a single possible number
+    Returns (status, index of the cell with the lowest possibilities, possible numbers of that cell)
+    """
+    cdef int i, row_index, column_index, box_index, count
+    cdef int status = NO_PROGRESS, best_idx = -1, best_pop = 10
+    cdef unsigned int possible_numbers, best_mask = 0
+
+    for i in range(81):
+        if cells[i]:
+            continue
+
+        row_index, column_index, box_index = ROW_OF[i], COL_OF[i], BOX_OF[i]
+        possible_numbers = row_mask[row_index] & col_mask[column_index] & box_mask[box_index]
+
+        if possible_numbers == 0:
+            return CONTRADICTION, -1, 0
+        elif possible_numbers & (possible_numbers - 1) == 0:  # Only a single bit is set
+            cells[i] = <signed char> __builtin_ctz(possible_numbers)
+            row_mask[row_index] &= <short> ~possible_numbers
+            col_mask[column_index] &= <short> ~possible_numbers
+            box_mask[box_index] &= <short> ~possible_numbers
+
+            status = PROGRESS
+        elif best_pop > 2:  # No cell with several possibilities can beat two
+            count = __builtin_popcount(possible_numbers)
+            if count < best_pop:
+                best_idx, best_pop, best_mask = i, count, possible_numbers
+
+    return status, best_idx, best_mask
+
+
+def hidden_singles(signed char[::1] cells, short[::1] row_mask, short[::1] col_mask, short[::1] box_mask):
+    """
+    Does one pass over the rows, columns and boxes, filling in every number that only fits in one cell of the unit
+    Returns CONTRADICTION if a missing number fits nowhere in a unit, otherwise NO_PROGRESS or PROGRESS
+    """
+    cdef int unit, j, i, target
+    cdef int status = NO_PROGRESS
+    cdef unsigned int placed, once, twice, possible_numbers, hidden, bit
+
+    for unit in range(27):
+        # Numbers already placed, possible in at least one empty cell, and possible in at least two empty cells
+        placed, once, twice = 0, 0, 0
+        for j in range(9):
+            i = UNITS[unit][j]
+            if cells[i]:
+                placed |= 1u << cells[i]
+            else:
+                possible_numbers = row_mask[ROW_OF[i]] & col_mask[COL_OF[i]] & box_mask[BOX_OF[i]]
+                twice |= once & possible_numbers
+                once |= possible_numbers
+
+        if 0x3FE & ~placed & ~once:
+            return CONTRADICTION
+
+        hidden = once & ~twice
+        while hidden:
+            bit = hidden & -hidden
+            hidden ^= bit
+
+            # An earlier number filled in on this pass may have taken the only cell
+            target = -1
+            for j in range(9):
+                i = UNITS[unit][j]
+                if cells[i] == 0 and row_mask[ROW_OF[i]] & col_mask[COL_OF[i]] & box_mask[BOX_OF[i]] & bit:
+                    target = i
+                    break
+            if target == -1:
+                return CONTRADICTION
+
+            cells[target] = <signed char> __builtin_ctz(bit)
+            row_mask[ROW_OF[target]] &= <short> ~bit
+            col_mask[COL_OF[target]] &= <short> ~bit
+            box_mask[BOX_OF[target]] &= <short> ~bit
+
+            status = PROGRESS
+
+    return status